@@ -1,77 +1,153 @@
 """Flask API：提供地震查询与 GeoJSON 输出。"""
-from flask import Flask, jsonify, request
+import math
+import os
+from datetime import datetime
+from typing import Any, Callable
+from urllib.parse import urlencode
+
+import orjson
+from flask import Flask, Response, request
+from flask_caching import Cache
 from flask_cors import CORS
 
 import service
+from database import TIME_FORMAT
+
+FLATGEOBUF_MIMETYPE = "application/flatgeobuf"
+CACHE_TIMEOUT = 60  # 读接口缓存时间（秒）
+CLUSTER_CACHE_TIMEOUT = 300  # 聚类统计变化慢，缓存更久
 
 app = Flask(__name__)
 CORS(app)
+cache = Cache(app, config={"CACHE_TYPE": "SimpleCache", "CACHE_DEFAULT_TIMEOUT": CACHE_TIMEOUT})
+
+
+def _json_default(obj: Any) -> str:
+    """datetime 按 GeoJSON 属性相同的 ISO 8601 Z 格式输出，其余类型转为字符串。"""
+    if isinstance(obj, datetime):
+        return obj.strftime(TIME_FORMAT)
+    return str(obj)
+
+
+def _json(obj: Any, status: int = 200) -> Response:
+    """用 orjson 序列化并直接返回 JSON 响应；已是 JSON 文本的结果原样返回。"""
+    if isinstance(obj, (str, bytes)):
+        body = obj
+    else:
+        body = orjson.dumps(obj, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME)
+    return Response(body, status=status, mimetype="application/json")
+
+
+def _all_finite(*values: float | None) -> bool:
+    """给出的数值参数均为有限数（未提供的参数不检查）；nan/inf 会被 type=float 接受，需单独拒绝。"""
+    return all(value is None or math.isfinite(value) for value in values)
+
+
+def _wants_flatgeobuf() -> bool:
+    """客户端在 Accept 中优先要求 FlatGeobuf 时返回二进制，默认仍为 GeoJSON。"""
+    best = request.accept_mimetypes.best_match(["application/json", FLATGEOBUF_MIMETYPE])
+    return best == FLATGEOBUF_MIMETYPE
+
+
+def _format_cache_key(*args: Any, **kwargs: Any) -> str:
+    """缓存键同时区分查询参数与响应格式。"""
+    # 参数经 urlencode 转义，值中的 & 和 = 不会与分隔符混淆
+    query = urlencode(sorted(request.args.items(multi=True)))
+    fmt = "fgb" if _wants_flatgeobuf() else "json"
+    return f"view/{request.path}?{query}#{fmt}"
+
+
+def _cacheable(response: Response) -> bool:
+    """编码失败的错误响应不写入缓存。"""
+    return response.status_code == 200
+
+
+def _geo_response(geojson_fn: Callable[[], Any], flatgeobuf_fn: Callable[[], bytes | None]) -> Response:
+    """按 Accept 头返回 GeoJSON 或 FlatGeobuf。"""
+    if _wants_flatgeobuf():
+        body = flatgeobuf_fn()
+        if body is None:
+            response = _json({"error": "failed to encode FlatGeobuf"}, 500)
+        else:
+            response = Response(body, mimetype=FLATGEOBUF_MIMETYPE)
+    else:
+        response = _json(geojson_fn())
+    response.vary.add("Accept")
+    return response
 
 
 @app.route("/earthquakes")
+@cache.cached(timeout=CACHE_TIMEOUT, query_string=True)
 def earthquakes_api():
     hours = request.args.get("hours", default=48, type=int)
     data = service.recent_events(hours=hours)
-    return jsonify(data)
+    return _json(data)
 
 
 @app.route("/earthquakes.geojson")
+@cache.cached(timeout=CACHE_TIMEOUT, make_cache_key=_format_cache_key, response_filter=_cacheable)
 def earthquakes_geojson():
     hours = request.args.get("hours", default=48, type=int)
-    lon = request.args.get("lon", type=float)
-    lat = request.args.get("lat", type=float)
-    radius_km = request.args.get("radius_km", type=float)
-    min_lon = request.args.get("min_lon", type=float)
-    min_lat = request.args.get("min_lat", type=float)
-    max_lon = request.args.get("max_lon", type=float)
-    max_lat = request.args.get("max_lat", type=float)
-
-    geojson = service.events(
-        hours=hours,
-        lon=lon,
-        lat=lat,
-        radius_km=radius_km,
-        min_lon=min_lon,
-        min_lat=min_lat,
-        max_lon=max_lon,
-        max_lat=max_lat,
+    filters = {
+        "lon": request.args.get("lon", type=float),
+        "lat": request.args.get("lat", type=float),
+        "radius_km": request.args.get("radius_km", type=float),
+        "min_lon": request.args.get("min_lon", type=float),
+        "min_lat": request.args.get("min_lat", type=float),
+        "max_lon": request.args.get("max_lon", type=float),
+        "max_lat": request.args.get("max_lat", type=float),
+    }
+    if not _all_finite(*filters.values()):
+        return _json({"error": "coordinates must be finite numbers"}, 400)
+    return _geo_response(
+        lambda: service.events(hours, **filters),
+        lambda: service.events_flatgeobuf(hours, **filters),
     )
-    return jsonify(geojson)
 
 
 @app.route("/earthquakes/near")
+@cache.cached(timeout=CACHE_TIMEOUT, query_string=True)
 def earthquakes_near():
     lon = request.args.get("lon", type=float)
     lat = request.args.get("lat", type=float)
     radius_km = request.args.get("radius_km", type=float)
     hours = request.args.get("hours", default=48, type=int)
     if lon is None or lat is None or radius_km is None:
-        return jsonify({"error": "lon, lat, radius_km are required"}), 400
+        return _json({"error": "lon, lat, radius_km are required"}, 400)
+    if not _all_finite(lon, lat, radius_km):
+        return _json({"error": "coordinates must be finite numbers"}, 400)
     geojson = service.nearby(lon, lat, radius_km, hours=hours)
-    return jsonify(geojson)
+    return _json(geojson)
 
 
 @app.route("/earthquakes/buffer")
+@cache.cached(timeout=CACHE_TIMEOUT, make_cache_key=_format_cache_key, response_filter=_cacheable)
 def earthquakes_buffer():
     radius_km = request.args.get("radius_km", type=float)
     hours = request.args.get("hours", default=48, type=int)
     if radius_km is None:
-        return jsonify({"error": "radius_km is required"}), 400
-    geojson = service.buffered(radius_km=radius_km, hours=hours)
-    return jsonify(geojson)
+        return _json({"error": "radius_km is required"}, 400)
+    if not _all_finite(radius_km):
+        return _json({"error": "radius_km must be a finite number"}, 400)
+    return _geo_response(
+        lambda: service.buffered(radius_km=radius_km, hours=hours),
+        lambda: service.buffered_flatgeobuf(radius_km=radius_km, hours=hours),
+    )
 
 
 @app.route("/earthquakes/overlay")
+@cache.cached(timeout=CACHE_TIMEOUT, query_string=True)
 def earthquakes_overlay():
     geom_text = request.args.get("geom")
     hours = request.args.get("hours", default=48, type=int)
     if not geom_text:
-        return jsonify({"error": "geom (WKT or GeoJSON) is required"}), 400
+        return _json({"error": "geom (WKT or GeoJSON) is required"}, 400)
     geojson = service.overlay(geom_text=geom_text, hours=hours)
-    return jsonify(geojson)
+    return _json(geojson)
 
 
 @app.route("/earthquakes/nearest")
+@cache.cached(timeout=CACHE_TIMEOUT, query_string=True)
 def earthquakes_nearest():
     lon = request.args.get("lon", type=float)
     lat = request.args.get("lat", type=float)
@@ -79,29 +155,37 @@ def earthquakes_nearest():
     hours = request.args.get("hours", default=24 * 30, type=int)
 
     if lon is None or lat is None:
-        return jsonify({"error": "lon and lat are required"}), 400
+        return _json({"error": "lon and lat are required"}, 400)
+    if not _all_finite(lon, lat):
+        return _json({"error": "coordinates must be finite numbers"}, 400)
 
     rows = service.nearest_events(lon=lon, lat=lat, limit=limit, hours=hours)
-    return jsonify(rows)
+    return _json(rows)
 
 
 @app.route("/stats/cluster")
+@cache.cached(timeout=CLUSTER_CACHE_TIMEOUT, query_string=True)
 def stats_cluster():
     cell_km = request.args.get("cell_km", default=50.0, type=float)
     hours = request.args.get("hours", default=48, type=int)
+    if not 0 < cell_km < math.inf:
+        return _json({"error": "cell_km must be a positive number"}, 400)
     rows = service.cluster_stats(cell_km=cell_km, hours=hours)
-    return jsonify(rows)
+    return _json(rows)
 
 
 @app.route("/earthquakes/timeline")
 def earthquakes_timeline():
+    """以 GeoJSON Text Sequence（RFC 8142）流式返回，每条记录为 RS + Feature + LF。"""
     start_time = request.args.get("start")
     end_time = request.args.get("end")
     limit = request.args.get("limit", default=2000, type=int)
-    geojson = service.timeline(start_iso=start_time, end_iso=end_time, limit=limit)
-    return jsonify(geojson)
+    batches = service.timeline(start_iso=start_time, end_iso=end_time, limit=limit)
+    # 参数已在生成器开始前读出，无需请求上下文；Tornado 的 WSGIContainer 会在任意线程上推进生成器
+    body = (b"".join(b"\x1e" + orjson.dumps(feature) + b"\n" for feature in batch) for batch in batches)
+    return Response(body, mimetype="application/geo+json-seq")
 
 
 if __name__ == "__main__":
 
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    app.run(host="0.0.0.0", port=5000, debug=os.environ.get("FLASK_DEBUG") == "1")
@@ -1,78 +1,334 @@
-import json
+import hashlib
 import logging
+import math
+import os
+import queue
+import struct
+import tempfile
 import threading
+from collections import OrderedDict
 from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import duckdb
+import numpy as np
+import orjson
+import pyarrow as pa
 
 DB_PATH = Path(__file__).resolve().with_name("earthquakes.duckdb")
 DEFAULT_EXTENSIONS: Set[str] = {"spatial"}
+DB_CONFIG: Dict[str, Any] = {
+    "threads": os.cpu_count() or 4,  # 空间扫描按行组并行
+    "memory_limit": "2GB",
+}
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"  # 接口输出时间统一为带 Z 的 ISO 8601 UTC 文本
+EARTH_RADIUS_KM = 6371.0
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+READER_POOL_SIZE = 8  # 只读游标数量上限，超出时请求排队等待
+READER_WAIT_SECONDS = 0.5  # 排队时重新检查游标数量的间隔（秒）
+PLAN_CACHE_SIZE = 128  # 每个连接缓存的查询构建器预编译语句数量
+STREAM_BATCH_ROWS = 512  # 流式输出时每批从 DuckDB 取出的行数
+EVENT_COLUMNS = 'unid, "time", latitude, longitude, depth, magnitude, region'  # 接口返回的列，不含 geom
+INSERT_BATCH_SCHEMA = pa.schema([
+    ("unid", pa.string()),
+    ("time", pa.timestamp("us")),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("depth", pa.float64()),
+    ("magnitude", pa.float64()),
+    ("region", pa.string()),
+])
+BUFFER_SEGMENTS = 32  # 缓冲圆的边数（与 ST_Buffer 默认的每象限 8 段一致）
+NEAREST_INITIAL_RADIUS_KM = 100.0  # 最近邻初始搜索半径，不足时逐次加倍
 logger = logging.getLogger(__name__)
 _connection_pool: "SingleConnectionPool | None" = None
+_pool_lock = threading.Lock()
+_write_hooks: List[Callable[[], None]] = []
+_installed_extensions: Set[str] = set()
+EMPTY_FEATURE_COLLECTION = b'{"type":"FeatureCollection","features":[]}'
 
 
 def load_extensions(conn: duckdb.DuckDBPyConnection, extensions: Set[str]) -> duckdb.DuckDBPyConnection:
     for ext in extensions:
-        conn.execute(f"INSTALL {ext}")
+        # INSTALL 在进程内只需执行一次
+        if ext not in _installed_extensions:
+            conn.execute(f"INSTALL {ext}")
+            _installed_extensions.add(ext)
         conn.execute(f"LOAD {ext}")
     return conn
 
 
 def get_db_connection(read_only: bool = False, extensions: Set[str] | None = None) -> duckdb.DuckDBPyConnection:
     """获取 DuckDB 连接，并确保空间扩展可用。"""
-    conn = duckdb.connect(str(DB_PATH), read_only=read_only)
+    conn = duckdb.connect(str(DB_PATH), read_only=read_only, config=DB_CONFIG)
     conn = load_extensions(conn, extensions or DEFAULT_EXTENSIONS)
     return conn
 
 class SingleConnectionPool:
-    """只创建并复用一个 DuckDB 连接，使用锁串行化访问。"""
-
-    def __init__(self, db_path: Path | None = None, extensions: Set[str] | None = None):
+    """只创建一个 DuckDB 连接：写入经锁串行化，读取从游标队列借出游标并发执行。"""
+
+    def __init__(
+        self,
+        db_path: Path | None = None,
+        extensions: Set[str] | None = None,
+        reader_pool_size: int = READER_POOL_SIZE,
+    ):
         self.db_path = db_path or DB_PATH
         self.extensions = extensions or DEFAULT_EXTENSIONS
+        self.reader_pool_size = reader_pool_size
         self._conn: duckdb.DuckDBPyConnection | None = None
         self._lock = threading.RLock()
+        self._readers: "queue.LifoQueue[Tuple[int, duckdb.DuckDBPyConnection]]" = queue.LifoQueue()
+        self._cursors: List[duckdb.DuckDBPyConnection] = []
+        self._generation = 0
+        self._prepared: Dict[int, Set[str]] = {}
+        self._plan_cache: Dict[int, "OrderedDict[str, str]"] = {}  # 连接 -> (SQL -> 预编译语句名)，LRU
+        self._loaded_extensions: Set[str] = set()  # 已加载到数据库实例的扩展，游标共享
 
     def _ensure_connection(self) -> duckdb.DuckDBPyConnection:
         if self._conn is None:
-            conn = duckdb.connect(str(self.db_path), read_only=False)
+            conn = duckdb.connect(str(self.db_path), read_only=False, config=DB_CONFIG)
             load_extensions(conn, self.extensions)
+            self._loaded_extensions = set(self.extensions)
             self._conn = conn
         return self._conn
 
+    def _load_extra(self, conn: duckdb.DuckDBPyConnection, extensions: Set[str] | None) -> None:
+        """只加载尚未加载过的扩展，已加载的跳过 LOAD。"""
+        missing = (extensions or set()) - self._loaded_extensions
+        if missing:
+            with self._lock:
+                load_extensions(conn, missing)
+                self._loaded_extensions |= missing
+
+    def _checkout_reader(self) -> Tuple[int, duckdb.DuckDBPyConnection]:
+        """借出一个只读游标；游标共享同一数据库实例，扩展无需重复加载。"""
+        while True:
+            try:
+                generation, cursor = self._readers.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    if len(self._cursors) < self.reader_pool_size:
+                        cursor = self._ensure_connection().cursor()
+                        self._cursors.append(cursor)
+                        return self._generation, cursor
+                try:
+                    generation, cursor = self._readers.get(timeout=READER_WAIT_SECONDS)
+                except queue.Empty:
+                    continue
+            # 连接池关闭后残留的旧游标直接丢弃
+            if generation == self._generation:
+                return generation, cursor
+
+    def _release_reader(self, generation: int, cursor: duckdb.DuckDBPyConnection) -> None:
+        if generation == self._generation:
+            self._readers.put((generation, cursor))
+
     @contextmanager
-    def acquire(self, extra_extensions: Set[str] | None = None) -> Iterable[duckdb.DuckDBPyConnection]:
+    def acquire(
+        self,
+        extra_extensions: Set[str] | None = None,
+        read_only: bool = False,
+    ) -> Iterable[duckdb.DuckDBPyConnection]:
+        if read_only:
+            generation, conn = self._checkout_reader()
+            try:
+                self._load_extra(conn, extra_extensions)
+                yield conn
+            finally:
+                self._release_reader(generation, conn)
+            return
         with self._lock:
             conn = self._ensure_connection()
-            if extra_extensions:
-                load_extensions(conn, extra_extensions)
+            self._load_extra(conn, extra_extensions)
             yield conn
 
+    def execute_prepared(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        name: str,
+        sql: str,
+        args: Iterable[Any],
+    ) -> duckdb.DuckDBPyConnection:
+        """以 PREPARE/EXECUTE 执行固定形状的查询，每个连接只解析、规划一次。"""
+        prepared = self._prepared.setdefault(id(conn), set())
+        if name not in prepared:
+            conn.execute(f"PREPARE {name} AS {sql}")
+            prepared.add(name)
+        return _execute_statement(conn, name, args)
+
+    def execute_cached(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        sql: str,
+        args: Iterable[Any],
+    ) -> duckdb.DuckDBPyConnection:
+        """按 SQL 文本缓存预编译语句（LRU），相同形状的构建器查询只解析、规划一次。
+
+        EXECUTE 只能以字面量传参；参数中含字符串（可能来自请求，如 WKT、时间范围）时
+        不走缓存，直接以绑定参数执行，请求文本不拼入 SQL。
+        """
+        args = list(args)
+        if any(isinstance(arg, str) for arg in args):
+            return conn.execute(sql, args)
+        cache = self._plan_cache.setdefault(id(conn), OrderedDict())
+        name = cache.get(sql)
+        if name is None:
+            name = f"q_{hashlib.sha1(sql.encode()).hexdigest()[:16]}"
+            conn.execute(f"PREPARE {name} AS {sql}")
+            cache[sql] = name
+            if len(cache) > PLAN_CACHE_SIZE:
+                _, evicted = cache.popitem(last=False)
+                conn.execute(f"DEALLOCATE {evicted}")
+        else:
+            cache.move_to_end(sql)
+        return _execute_statement(conn, name, args)
+
     def close(self) -> None:
         with self._lock:
+            for cursor in self._cursors:
+                cursor.close()
+            self._cursors.clear()
+            self._prepared.clear()
+            self._plan_cache.clear()
+            self._loaded_extensions.clear()
+            self._generation += 1
             if self._conn is not None:
                 self._conn.close()
                 self._conn = None
 
 
-@contextmanager
-def _connection_scope(read_only: bool = False, extensions: Set[str] | None = None) -> Iterable[duckdb.DuckDBPyConnection]:
-    """统一的连接上下文，如果存在池则复用单连接。"""
+def _get_pool() -> SingleConnectionPool:
     global _connection_pool
     if _connection_pool is None:
-        _connection_pool = SingleConnectionPool()
-    pool = _connection_pool
-    with pool.acquire(extensions) as conn:
+        with _pool_lock:
+            if _connection_pool is None:
+                _connection_pool = SingleConnectionPool()
+    return _connection_pool
+
+
+def _sql_literal(value: Any) -> str:
+    """把参数渲染为 SQL 字面量（EXECUTE 不支持绑定参数）；字符串按 SQL 标准转义单引号。"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    if isinstance(value, datetime):
+        return f"TIMESTAMP '{value.isoformat(sep=' ')}'"
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, float) and math.isfinite(value):
+        return repr(value)
+    raise ValueError(f"Unsupported prepared statement argument: {value!r}")
+
+
+def _execute_statement(conn: duckdb.DuckDBPyConnection, name: str, args: Iterable[Any]) -> duckdb.DuckDBPyConnection:
+    literals = [_sql_literal(arg) for arg in args]
+    return conn.execute(f"EXECUTE {name}({', '.join(literals)})" if literals else f"EXECUTE {name}")
+
+
+def _execute_prepared(
+    conn: duckdb.DuckDBPyConnection,
+    name: str,
+    sql: str,
+    args: Iterable[Any],
+) -> duckdb.DuckDBPyConnection:
+    return _get_pool().execute_prepared(conn, name, sql, args)
+
+
+def _execute_cached(
+    conn: duckdb.DuckDBPyConnection,
+    sql: str,
+    args: Iterable[Any],
+) -> duckdb.DuckDBPyConnection:
+    return _get_pool().execute_cached(conn, sql, args)
+
+
+@contextmanager
+def _connection_scope(read_only: bool = False, extensions: Set[str] | None = None) -> Iterable[duckdb.DuckDBPyConnection]:
+    """统一的连接上下文：读请求从有界队列借出游标、用完归还，写请求经锁复用单连接。"""
+    with _get_pool().acquire(extensions, read_only=read_only) as conn:
         yield conn
 
 
-def _cutoff_iso(hours: int) -> str:
-    """返回距现在 N 小时的 ISO 字符串。"""
-    cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
-    return cutoff.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+def add_write_hook(hook: Callable[[], None]) -> None:
+    """注册写入新数据后的回调（例如清理 API 缓存）。"""
+    _write_hooks.append(hook)
+
+
+def _notify_write() -> None:
+    for hook in _write_hooks:
+        try:
+            hook()
+        except Exception:
+            logger.exception("Error running write hook")
+
+
+def _rows_to_dicts(result: duckdb.DuckDBPyConnection) -> List[Dict[str, Any]]:
+    """经 Arrow 列式结果批量转换为字典列表。"""
+    return result.fetch_arrow_table().to_pylist()
+
+
+def _copy_flatgeobuf(conn: duckdb.DuckDBPyConnection, sql: str, params: Iterable[Any]) -> bytes:
+    """经 spatial 扩展的 GDAL 写出器把查询结果编码为 FlatGeobuf，返回文件字节。"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "result.fgb"
+        conn.execute(f"COPY ({sql}) TO '{path}' WITH (FORMAT GDAL, DRIVER 'FlatGeobuf')", params)
+        return path.read_bytes()
+
+
+def _point_feature(row: Dict[str, Any]) -> Dict[str, Any]:
+    """由一行属性构造 GeoJSON 点要素；坐标直接取经纬度列，无需解析几何。"""
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [row["longitude"], row["latitude"]]},
+        "properties": row,
+    }
+
+
+def _cutoff(hours: int) -> datetime:
+    """返回距现在 N 小时的 UTC 时间，直接与 TIMESTAMP 列比较。"""
+    return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=hours)
+
+
+def _unit_vector(lon: float, lat: float) -> Tuple[float, float, float]:
+    """经纬度转单位球面上的 ECEF 坐标 (cx, cy, cz)，与表中预存列一致。"""
+    lon_rad = math.radians(lon)
+    lat_rad = math.radians(lat)
+    cos_lat = math.cos(lat_rad)
+    return cos_lat * math.cos(lon_rad), cos_lat * math.sin(lon_rad), math.sin(lat_rad)
+
+
+def _chord_sq_sql(lon: float, lat: float) -> Tuple[str, List[float]]:
+    """到指定点的单位球弦长平方的 SQL 表达式及其参数（单位向量在 Python 侧算好，逐行无三角函数）。
+
+    查询点以绑定参数传入，不同点的 SQL 文本相同，可复用缓存的执行计划。
+    """
+    ux, uy, uz = _unit_vector(lon, lat)
+    return "(cx - ?) * (cx - ?) + (cy - ?) * (cy - ?) + (cz - ?) * (cz - ?)", [ux, ux, uy, uy, uz, uz]
+
+
+def _radius_bbox(lon: float, lat: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """返回覆盖给定圆的经纬度外包矩形 (min_lon, min_lat, max_lon, max_lat)。
+
+    圆覆盖极点或跨越 ±180° 经线时，经度直接取全范围。
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    lat_rad = math.radians(lat)
+    min_lat = math.degrees(lat_rad - angular)
+    max_lat = math.degrees(lat_rad + angular)
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return -180.0, max(min_lat, -90.0), 180.0, min(max_lat, 90.0)
+
+    ratio = math.sin(angular) / math.cos(lat_rad)
+    if ratio >= 1.0:
+        return -180.0, min_lat, 180.0, max_lat
+    dlon = math.degrees(math.asin(ratio))
+    if lon - dlon < -180.0 or lon + dlon > 180.0:
+        return -180.0, min_lat, 180.0, max_lat
+    return lon - dlon, min_lat, lon + dlon, max_lat
 
 
 class EarthquakeQuery:
@@ -81,20 +337,32 @@ class EarthquakeQuery:
     def __init__(self):
         self._where_clauses: List[str] = []
         self._params: List[Any] = []
-        self._select_fields: str = "*"
+        self._select_fields: str = EVENT_COLUMNS
+        self._select_params: List[Any] = []  # SELECT 中计算列的参数，位于 WHERE 参数之前
         self._order_by: str = "time DESC"
+        self._order_params: List[Any] = []  # ORDER BY 表达式的参数，位于 WHERE 参数之后
         self._limit: Optional[int] = None
-        self._require_geom: bool = False
+        self._extra_properties: List[str] = []  # 附加到 GeoJSON properties 的计算列
     
     def select(self, fields: str) -> "EarthquakeQuery":
         """指定 SELECT 字段。"""
         self._select_fields = fields
         return self
     
+    def _with_distance(self, lon: float, lat: float) -> Tuple[str, List[float]]:
+        """在 SELECT 中附加到指定点的球面距离 distance_m（米），返回弦长平方表达式及其参数。"""
+        chord_sq, chord_params = _chord_sq_sql(lon, lat)
+        if "distance_m" not in self._extra_properties:
+            distance = f"2 * {_sql_literal(EARTH_RADIUS_M)} * asin(least(1.0, sqrt({chord_sq}) / 2))"
+            self._select_fields = f"{self._select_fields}, {distance} AS distance_m"
+            self._select_params.extend(chord_params)
+            self._extra_properties.append("distance_m")
+        return chord_sq, chord_params
+    
     def since(self, hours: int) -> "EarthquakeQuery":
         """筛选最近 N 小时的数据。"""
         self._where_clauses.append("time > ?")
-        self._params.append(_cutoff_iso(hours))
+        self._params.append(_cutoff(hours))
         return self
     
     def time_range(self, start_iso: Optional[str] = None, end_iso: Optional[str] = None) -> "EarthquakeQuery":
@@ -108,26 +376,23 @@ class EarthquakeQuery:
         return self
     
     def within_radius(self, lon: float, lat: float, radius_km: float) -> "EarthquakeQuery":
-        """按圆形范围筛选（半径 km）。"""
-        radius_m = radius_km * 1000
-        self._where_clauses.append(
-            """ST_DWithin(
-                CAST(geom AS GEOGRAPHY),
-                CAST(ST_Point(?, ?) AS GEOGRAPHY),
-                ?
-            )"""
-        )
-        self._params.extend([lon, lat, radius_m])
-        self._require_geom = True
+        """按圆形范围筛选（半径 km），先用外包矩形粗筛再做精确距离判断，结果附带 distance_m。"""
+        # 外包矩形与 geom 做常量几何相交，可走 R-Tree 索引剪枝
+        self.in_bbox(*_radius_bbox(lon, lat, radius_km))
+        # 球面距离 d 对应弦长 2·sin(d / 2R)，比较弦长平方即可，无需逐行转换为 GEOGRAPHY
+        max_chord = 2 * math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi) / 2)
+        chord_sq, chord_params = self._with_distance(lon, lat)
+        self._where_clauses.append(f"{chord_sq} <= ?")
+        self._params.extend(chord_params)
+        self._params.append(max_chord * max_chord)
         return self
     
     def in_bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> "EarthquakeQuery":
         """按矩形范围筛选。"""
         self._where_clauses.append(
-            "ST_Intersects(geom, ST_MakeEnvelope(?, ?, ?, ?, 4326))"
+            "ST_Intersects(geom, ST_MakeEnvelope(?, ?, ?, ?))"
         )
         self._params.extend([min_lon, min_lat, max_lon, max_lat])
-        self._require_geom = True
         return self
     
     def intersects(self, geom_text: str) -> "EarthquakeQuery":
@@ -138,21 +403,24 @@ class EarthquakeQuery:
             geom_expr = "ST_GeomFromText(?)"
         self._where_clauses.append(f"ST_Intersects(geom, {geom_expr})")
         self._params.append(geom_text)
-        self._require_geom = True
         return self
     
     def nearest(self, lon: float, lat: float, limit: int = 10) -> "EarthquakeQuery":
-        """最近邻查询。"""
-        self._select_fields = "*, ST_Distance_Sphere(geom, ST_Point(?, ?)) AS distance_m"
-        self._params = [lon, lat] + self._params
-        self._order_by = "distance_m ASC"
+        """最近邻查询。
+
+        按预存单位向量的弦长平方排序（与球面距离单调一致，无需逐行三角函数），
+        distance_m 只对 LIMIT 内的结果换算为球面距离。
+        """
+        chord_sq, chord_params = self._with_distance(lon, lat)
+        self._order_by = f"{chord_sq} ASC"
+        self._order_params = chord_params
         self._limit = limit
-        self._require_geom = True
         return self
     
     def order_by(self, order: str) -> "EarthquakeQuery":
         """指定排序。"""
         self._order_by = order
+        self._order_params = []
         return self
     
     def limit(self, n: int) -> "EarthquakeQuery":
@@ -160,25 +428,13 @@ class EarthquakeQuery:
         self._limit = n
         return self
     
-    def _build_sql(self) -> Tuple[str, List[Any]]:
-        """构建最终的 SQL 语句。"""
-        # 处理 SELECT 中的参数（如 nearest 查询）
-        select_params = []
-        if "ST_Distance_Sphere" in self._select_fields:
-            # 提取前两个参数用于 SELECT
-            select_params = self._params[:2]
-            where_params = self._params[2:]
-        else:
-            where_params = self._params
-        
-        sql_parts = [f"SELECT {self._select_fields} FROM earthquakes"]
+    def _build_sql(self, with_geom: bool = False) -> Tuple[str, List[Any]]:
+        """构建最终的 SQL 语句；with_geom 为真时额外选出 geom 供外层包装查询使用。"""
+        select_fields = f"{self._select_fields}, geom" if with_geom else self._select_fields
+        sql_parts = [f"SELECT {select_fields} FROM earthquakes"]
         
-        where_clauses = self._where_clauses.copy()
-        if self._require_geom:
-            where_clauses.insert(0, "geom IS NOT NULL")
-        
-        if where_clauses:
-            sql_parts.append("WHERE " + " AND ".join(where_clauses))
+        if self._where_clauses:
+            sql_parts.append("WHERE " + " AND ".join(self._where_clauses))
         
         sql_parts.append(f"ORDER BY {self._order_by}")
         
@@ -186,71 +442,81 @@ class EarthquakeQuery:
             sql_parts.append(f"LIMIT {self._limit}")
         
         sql = "\n".join(sql_parts)
-        params = select_params + where_params
-        
-        return sql, params
+        return sql, self._select_params + self._params + self._order_params
     
     def execute(self) -> List[Dict[str, Any]]:
         """执行查询并返回字典列表。"""
         sql, params = self._build_sql()
         try:
             with _connection_scope(read_only=True) as conn:
-                df = conn.execute(sql, params).df()
-                if "geom" in df.columns:
-                    df = df.drop(columns=["geom"])
-                return df.to_dict(orient="records")
+                return _rows_to_dicts(_execute_cached(conn, sql, params))
         except Exception:
             logger.exception("Error executing query")
             return []
     
-    def to_geojson(self) -> Dict[str, Any]:
-        """执行查询并返回 GeoJSON FeatureCollection。"""
+    def _feature_sql(self) -> Tuple[str, List[Any]]:
+        """选出构造点要素所需的属性列（时间已格式化为 ISO 8601 UTC 文本）。"""
         sql, params = self._build_sql()
-        
-        # 包装为 GeoJSON 生成查询
-        geojson_sql = f"""
-        SELECT json_object(
-            'type', 'FeatureCollection',
-            'features', json_group_array(
-                json_object(
-                    'type', 'Feature',
-                    'geometry', json(ST_AsGeoJSON(geom)),
-                    'properties', json_object(
-                        'unid', unid,
-                        'time', "time",
-                        'latitude', latitude,
-                        'longitude', longitude,
-                        'depth', depth,
-                        'magnitude', magnitude,
-                        'region', region
-                    )
-                )
-            )
-        ) as geojson
+        extra_columns = "".join(f", {name}" for name in self._extra_properties)
+        feature_sql = f"""
+        SELECT
+            unid,
+            strftime("time", '{TIME_FORMAT}') AS "time",
+            latitude, longitude, depth, magnitude, region{extra_columns}
         FROM ({sql})
-        WHERE geom IS NOT NULL
         """
+        return feature_sql, params
+    
+    def to_geojson(self) -> bytes:
+        """执行查询并返回 GeoJSON FeatureCollection 字节串（经 Arrow 取列后由 orjson 一次性序列化）。"""
+        sql, params = self._feature_sql()
         try:
             with _connection_scope(read_only=True) as conn:
-                result = conn.execute(geojson_sql, params).fetchone()
-                return json.loads(result[0]) if result and result[0] else {"type": "FeatureCollection", "features": []}
+                rows = _execute_cached(conn, sql, params).fetch_arrow_table().to_pylist()
         except Exception:
             logger.exception("Error executing GeoJSON query")
-            return {"type": "FeatureCollection", "features": []}
+            return EMPTY_FEATURE_COLLECTION
+        if not rows:
+            return EMPTY_FEATURE_COLLECTION
+        return orjson.dumps({"type": "FeatureCollection", "features": [_point_feature(row) for row in rows]})
     
+    def to_flatgeobuf(self) -> bytes | None:
+        """执行查询并返回 FlatGeobuf 二进制，出错时返回 None。"""
+        sql, params = self._build_sql(with_geom=True)
+        try:
+            with _connection_scope(read_only=True) as conn:
+                return _copy_flatgeobuf(conn, sql, params)
+        except Exception:
+            logger.exception("Error executing FlatGeobuf query")
+            return None
+
+    def iter_feature_batches(self, batch_size: int = STREAM_BATCH_ROWS) -> Iterator[List[Dict[str, Any]]]:
+        """按 Arrow 记录批次流式产出 GeoJSON Feature 列表，避免一次性构建完整结果。"""
+        stream_sql, params = self._feature_sql()
+        try:
+            # 流式结果会跨越多次 yield，使用独立游标以免与同线程的其他查询冲突
+            with _connection_scope(read_only=True) as conn:
+                cursor = conn.cursor()
+            try:
+                reader = cursor.execute(stream_sql, params).fetch_record_batch(batch_size)
+                for batch in reader:
+                    yield [_point_feature(row) for row in batch.to_pylist()]
+            finally:
+                cursor.close()
+        except Exception:
+            logger.exception("Error streaming GeoJSON features")
+
     def to_sql(self) -> Tuple[str, List[Any]]:
         """返回 SQL 语句和参数（用于调试）。"""
         return self._build_sql()
 
 
 def insert_earthquake(data: Dict[str, Any]) -> bool:
-    """插入一条地震数据，如果存在则忽略。"""
-    query = """
-        INSERT INTO earthquakes (unid, time, latitude, longitude, depth, magnitude, region, geom)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ST_Point(?, ?))
-        ON CONFLICT (unid) DO NOTHING
+    """插入一条地震数据，如果存在则忽略。
+
+    unid、region 等字符串来自外部数据源，以绑定参数传入，不拼入 SQL 文本。
     """
-    params: Iterable[Any] = (
+    args: Iterable[Any] = (
         data["unid"],
         data["time"],
         data["latitude"],
@@ -258,18 +524,64 @@ def insert_earthquake(data: Dict[str, Any]) -> bool:
         data.get("depth"),
         data["magnitude"],
         data["region"],
-        data["longitude"],
-        data["latitude"],
+        *_unit_vector(data["longitude"], data["latitude"]),
     )
     try:
         with _connection_scope(read_only=False) as conn:
-            conn.execute(query, params)
+            inserted = conn.execute(
+                """
+                INSERT INTO earthquakes (unid, time, latitude, longitude, depth, magnitude, region, geom, cx, cy, cz)
+                VALUES ($1, $2, $3, $4, $5, $6, replace($7, ',', ' '), ST_Point($4, $3), $8, $9, $10)
+                ON CONFLICT (unid) DO NOTHING
+                """,
+                args,
+            ).fetchone()[0]
+        if inserted:
+            _notify_write()
         return True
     except Exception:
         logger.exception("Error inserting earthquake")
         return False
 
 
+def insert_earthquakes(rows: List[Dict[str, Any]]) -> int:
+    """批量插入地震数据（已存在的 unid 忽略），返回实际写入的行数。
+
+    整批数据作为一张 Arrow 表注册给 DuckDB，以单条 INSERT ... SELECT 写入。
+    """
+    if not rows:
+        return 0
+    try:
+        batch = pa.Table.from_pylist(
+            [{name: row.get(name) for name in INSERT_BATCH_SCHEMA.names} for row in rows],
+            schema=INSERT_BATCH_SCHEMA,
+        )
+        with _connection_scope(read_only=False) as conn:
+            conn.register("earthquake_batch", batch)
+            try:
+                inserted = conn.execute(
+                    """
+                    INSERT INTO earthquakes (unid, time, latitude, longitude, depth, magnitude, region, geom, cx, cy, cz)
+                    SELECT
+                        unid, time, latitude, longitude, depth, magnitude, replace(region, ',', ' '),
+                        ST_Point(longitude, latitude),
+                        cos(radians(latitude)) * cos(radians(longitude)),
+                        cos(radians(latitude)) * sin(radians(longitude)),
+                        sin(radians(latitude))
+                    FROM earthquake_batch
+                    ON CONFLICT (unid) DO NOTHING
+                    """
+                ).fetchone()[0]
+            finally:
+                conn.unregister("earthquake_batch")
+    except Exception:
+        logger.exception("Error inserting earthquake batch")
+        return 0
+    if inserted:
+        _notify_write()
+    return inserted
+
+
 # ========== 向后兼容的便捷函数 ==========
 
 def get_recent_earthquakes(hours: int = 48) -> List[Dict[str, Any]]:
@@ -309,57 +621,155 @@ def query_nearest(
     limit: int = 10,
     hours: int = 24 * 30,
 ) -> List[Dict[str, Any]]:
-    """最近邻查询，按距离排序返回指定数量。"""
-    return EarthquakeQuery().since(hours).nearest(lon, lat, limit).execute()
+    """最近邻查询，按距离排序返回指定数量。
+
+    时间窗口内的事件不超过 limit 条时直接全量排序；否则从 NEAREST_INITIAL_RADIUS_KM 起
+    在外包矩形内求距离（可走 geom 的 RTREE 索引），候选不足或第 limit 个结果超出该半径时半径加倍，
+    外包矩形覆盖全球后的结果即为最终结果。
+    """
+    if limit <= 0:
+        return []
+    cutoff = _cutoff(hours)
+    try:
+        with _connection_scope(read_only=True) as conn:
+            window_count = _execute_prepared(
+                conn,
+                "window_count",
+                "SELECT COUNT(*) FROM earthquakes WHERE time > $1",
+                [cutoff],
+            ).fetchone()[0]
+    except Exception:
+        logger.exception("Error counting events for nearest query")
+        return []
+    if window_count <= limit:
+        return EarthquakeQuery().since(hours).nearest(lon, lat, limit).execute()
 
+    radius_km = NEAREST_INITIAL_RADIUS_KM
+    while True:
+        bbox = _radius_bbox(lon, lat, radius_km)
+        rows = EarthquakeQuery().since(hours).in_bbox(*bbox).nearest(lon, lat, limit).execute()
+        if bbox == (-180.0, -90.0, 180.0, 90.0):
+            return rows
+        if rows and len(rows) >= limit and rows[-1]["distance_m"] <= radius_km * 1000:
+            return rows
+        radius_km *= 2
 
-def buffered_events(radius_km: float, hours: int = 48) -> List[Dict[str, Any]]:
-    """返回按时间筛选后的地震，并给出缓冲区几何的 GeoJSON。"""
-    radius_m = radius_km * 1000
+
+def _circle_rings(lons: np.ndarray, lats: np.ndarray, radius_km: float) -> np.ndarray:
+    """批量生成球面上以各点为圆心、半径 radius_km 的闭合环，形状 (n, BUFFER_SEGMENTS + 1, 2)。
+
+    方位角模板只算一次，各点按球面正算公式整体向量化平移，不逐行构造缓冲几何。
+    """
+    bearings = np.linspace(0.0, 2 * np.pi, BUFFER_SEGMENTS + 1)
+    sin_b, cos_b = np.sin(bearings), np.cos(bearings)
+    delta = radius_km / EARTH_RADIUS_KM
+    sin_d, cos_d = math.sin(delta), math.cos(delta)
+
+    lat1 = np.radians(lats)[:, None]
+    lon1 = np.radians(lons)[:, None]
+    sin_lat1, cos_lat1 = np.sin(lat1), np.cos(lat1)
+    sin_lat2 = np.clip(sin_lat1 * cos_d + cos_lat1 * sin_d * cos_b, -1.0, 1.0)
+    lat2 = np.arcsin(sin_lat2)
+    lon2 = lon1 + np.arctan2(sin_b * sin_d * cos_lat1, cos_d - sin_lat1 * sin_lat2)
+
+    rings = np.stack([np.degrees(lon2), np.degrees(lat2)], axis=-1)
+    rings[:, -1] = rings[:, 0]  # 首尾坐标严格一致
+    return rings
+
+
+def _polygon_wkb(ring: np.ndarray) -> bytes:
+    """单环多边形的 WKB（小端）。"""
+    return struct.pack("<BIII", 1, 3, 1, len(ring)) + ring.astype("<f8").tobytes()
+
+
+def _buffered_source(radius_km: float, hours: int) -> Tuple[pa.Table, np.ndarray] | None:
+    """取出时间窗口内的地震并生成缓冲环，出错时返回 None。"""
     try:
         with _connection_scope(read_only=True) as conn:
-            result = conn.execute(
-                """
-                SELECT
-                    unid, time, latitude, longitude, depth, magnitude, region,
-                    ST_AsGeoJSON(
-                        ST_Buffer(
-                            CAST(geom AS GEOGRAPHY),
-                            ?
-                        )::GEOMETRY
-                    ) AS buffer_geojson
-                FROM earthquakes
-                WHERE time > ? AND geom IS NOT NULL
-                """,
-                [radius_m, _cutoff_iso(hours)],
-            )
-            return result.df().to_dict(orient="records")
+            table = _execute_prepared(
+                conn,
+                "buffered_events",
+                f"SELECT {EVENT_COLUMNS} FROM earthquakes WHERE time > $1 ORDER BY time DESC",
+                [_cutoff(hours)],
+            ).fetch_arrow_table()
     except Exception:
         logger.exception("Error executing buffered_events query")
+        return None
+    rings = _circle_rings(
+        table.column("longitude").to_numpy(),
+        table.column("latitude").to_numpy(),
+        radius_km,
+    )
+    return table, rings
+
+
+def buffered_events(radius_km: float, hours: int = 48) -> List[Dict[str, Any]]:
+    """返回按时间筛选后的地震，buffer_ring 字段为缓冲圆的闭合坐标环。"""
+    source = _buffered_source(radius_km, hours)
+    if source is None:
         return []
+    table, rings = source
+    rows = table.to_pylist()
+    for row, ring in zip(rows, rings.tolist()):
+        row["buffer_ring"] = ring
+    return rows
+
+
+def buffered_events_flatgeobuf(radius_km: float, hours: int = 48) -> bytes | None:
+    """缓冲区查询结果编码为 FlatGeobuf，出错时返回 None。"""
+    source = _buffered_source(radius_km, hours)
+    if source is None:
+        return None
+    table, rings = source
+    table = table.append_column("buffer_wkb", pa.array([_polygon_wkb(ring) for ring in rings], pa.binary()))
+    try:
+        with _connection_scope(read_only=True) as conn:
+            conn.register("buffer_batch", table)
+            try:
+                return _copy_flatgeobuf(
+                    conn,
+                    "SELECT * EXCLUDE (buffer_wkb), ST_GeomFromWKB(buffer_wkb) AS buffer_geom FROM buffer_batch",
+                    [],
+                )
+            finally:
+                conn.unregister("buffer_batch")
+    except Exception:
+        logger.exception("Error executing buffered_events FlatGeobuf query")
+        return None
 
 
 def cluster_grid(cell_km: float = 50, hours: int = 48) -> List[Dict[str, Any]]:
-    """基于简单网格的聚类统计，返回格网中心和数量。"""
+    """基于简单网格的聚类统计，返回格网中心和数量。
+
+    行列号由坐标乘以预先求出的 1/step 再取整得到（避免逐行除法），合并为单个 BIGINT 键分组，
+    哈希一个整数比哈希两个 DOUBLE 更便宜。
+    """
+    if not 0 < cell_km < math.inf:
+        # 非正或非有限的格网尺寸无法构成有效的行列键
+        return []
     step_deg = cell_km / 111.0
+    # 经度方向的格子数上界，保证 lat_bin * row_width + lon_bin 唯一
+    row_width = 2 * math.ceil(180.0 / step_deg) + 1
     try:
         with _connection_scope(read_only=True) as conn:
-            result = conn.execute(
+            result = _execute_prepared(
+                conn,
+                "cluster_grid",
                 """
                 WITH bucketed AS (
                     SELECT
-                        FLOOR(longitude / ?) AS lon_bin,
-                        FLOOR(latitude / ?) AS lat_bin,
+                        CAST(FLOOR(longitude * $1) AS BIGINT) AS lon_bin,
+                        CAST(FLOOR(latitude * $1) AS BIGINT) AS lat_bin,
                         longitude,
                         latitude,
                         magnitude,
                         time
                     FROM earthquakes
-                    WHERE time > ? AND geom IS NOT NULL
+                    WHERE time > $2
                 )
                 SELECT
-                    lon_bin,
-                    lat_bin,
+                    any_value(lon_bin) AS lon_bin,
+                    any_value(lat_bin) AS lat_bin,
                     COUNT(*) AS count,
                     AVG(magnitude) AS avg_magnitude,
                     MIN(time) AS min_time,
@@ -367,13 +777,12 @@ def cluster_grid(cell_km: float = 50, hours: int = 48) -> List[Dict[str, Any]]:
                     AVG(longitude) AS center_lon,
                     AVG(latitude) AS center_lat
                 FROM bucketed
-                GROUP BY lon_bin, lat_bin
-                HAVING count > 0
+                GROUP BY lat_bin * $3 + lon_bin
                 ORDER BY count DESC
                 """,
-                [step_deg, step_deg, _cutoff_iso(hours)],
+                [1.0 / step_deg, _cutoff(hours), row_width],
             )
-            return result.df().to_dict(orient="records")
+            return _rows_to_dicts(result)
     except Exception:
         logger.exception("Error executing cluster_grid query")
         return []
@@ -0,0 +1,14 @@
+"""Gunicorn 配置：单独部署 Flask API（gunicorn -c gunicorn.conf.py api:app）。"""
+
+import os
+
+bind = os.environ.get("API_BIND", "0.0.0.0:5000")
+
+# DuckDB 数据库文件同一时间只允许一个进程以读写方式打开，
+# 因此只启动一个 worker，靠线程并发处理请求（读查询从连接池的游标队列借出游标）。
+workers = 1
+worker_class = "gthread"
+threads = int(os.environ.get("API_THREADS", "8"))
+
+# 连接池在首次请求时惰性创建；DuckDB 连接不能跨 fork 共享，不做预加载
+preload_app = False
@@ -3,6 +3,7 @@
 
 import logging
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 import duckdb
 
@@ -41,7 +42,10 @@ def create_tables(conn: duckdb.DuckDBPyConnection, schema: str = "") -> None:
             depth DOUBLE,
             magnitude DOUBLE NOT NULL,
             region VARCHAR,
-            geom GEOMETRY,
+            geom GEOMETRY NOT NULL,
+            cx DOUBLE,  -- 单位球面 ECEF 坐标，用于最近邻排序
+            cy DOUBLE,
+            cz DOUBLE,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
@@ -49,17 +53,123 @@ def create_tables(conn: duckdb.DuckDBPyConnection, schema: str = "") -> None:
     # 创建索引
     conn.execute(f"""
         CREATE INDEX IF NOT EXISTS idx_earthquakes_time 
-        ON {table_name}(time DESC)
+        ON {table_name}(time)
     """)
     
+    # ART 索引不参与 time > ? 这类范围过滤，复合索引只会拖慢写入，已建过的一并删除
+    prefix = f"{schema}." if schema else ""
+    conn.execute(f"DROP INDEX IF EXISTS {prefix}idx_earthquakes_time_magnitude")
+
     conn.execute(f"""
         CREATE INDEX IF NOT EXISTS idx_earthquakes_magnitude 
         ON {table_name}(magnitude DESC)
     """)
     
+    # geom 上的 R-Tree 索引（spatial 扩展提供），常量几何的 ST_Intersects 等过滤可走索引扫描
+    conn.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_earthquakes_geom
+        ON {table_name} USING RTREE (geom)
+    """)
+    
     logger.info("✓ 表结构已创建")
 
 
+def backfill_geom(conn: duckdb.DuckDBPyConnection, schema: str = "") -> None:
+    """为缺少 geom 的旧记录补齐点几何（写入路径已直接写入 geom，只需初始化时执行一次）。"""
+    table_name = f"{schema}.earthquakes" if schema else "earthquakes"
+    updated = conn.execute(f"""
+        UPDATE {table_name}
+        SET geom = ST_Point(longitude, latitude)
+        WHERE geom IS NULL AND longitude IS NOT NULL AND latitude IS NOT NULL
+    """).fetchone()[0]
+    if updated:
+        logger.info("✓ 已为 %d 条记录补齐 geom", updated)
+
+
+def backfill_unit_vectors(conn: duckdb.DuckDBPyConnection, schema: str = "") -> None:
+    """为旧表补充 cx/cy/cz 列并填充缺失值（最近邻查询按弦长排序依赖这三列）。"""
+    table_name = f"{schema}.earthquakes" if schema else "earthquakes"
+    for column in ("cx", "cy", "cz"):
+        conn.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column} DOUBLE")
+    updated = conn.execute(f"""
+        UPDATE {table_name}
+        SET cx = cos(radians(latitude)) * cos(radians(longitude)),
+            cy = cos(radians(latitude)) * sin(radians(longitude)),
+            cz = sin(radians(latitude))
+        WHERE cx IS NULL AND longitude IS NOT NULL AND latitude IS NOT NULL
+    """).fetchone()[0]
+    if updated:
+        logger.info("✓ 已为 %d 条记录补齐 cx/cy/cz", updated)
+
+
+def _catalog_filter(schema: str) -> Tuple[str, List[str]]:
+    """duckdb_columns()/duckdb_indexes() 中定位目标数据库的过滤条件。"""
+    if schema:
+        return "database_name = ?", [schema]
+    return "database_name = current_database()", []
+
+
+def _alter_with_indexes(conn: duckdb.DuckDBPyConnection, schema: str, alter_sql: str) -> None:
+    """执行 ALTER TABLE；存在依赖索引时无法修改列，先删除索引再按原 SQL 重建。"""
+    table_name = f"{schema}.earthquakes" if schema else "earthquakes"
+    database_filter, filter_params = _catalog_filter(schema)
+    indexes = conn.execute(
+        f"SELECT index_name, sql FROM duckdb_indexes() WHERE {database_filter} AND table_name = 'earthquakes'",
+        filter_params,
+    ).fetchall()
+    prefix = f"{schema}." if schema else ""
+    for index_name, _ in indexes:
+        conn.execute(f"DROP INDEX {prefix}{index_name}")
+
+    conn.execute(alter_sql)
+
+    for _, index_sql in indexes:
+        conn.execute(index_sql.replace(" ON earthquakes", f" ON {table_name}", 1))
+
+
+def _column_info(conn: duckdb.DuckDBPyConnection, schema: str, column: str) -> Optional[Tuple[str, bool]]:
+    """返回 earthquakes 表某列的 (类型, 是否可空)，列不存在时返回 None。"""
+    database_filter, filter_params = _catalog_filter(schema)
+    return conn.execute(
+        f"""
+        SELECT data_type, is_nullable FROM duckdb_columns()
+        WHERE {database_filter} AND table_name = 'earthquakes' AND column_name = ?
+        """,
+        filter_params + [column],
+    ).fetchone()
+
+
+def migrate_time_column(conn: duckdb.DuckDBPyConnection, schema: str = "") -> None:
+    """把旧库中以 VARCHAR 存储的 time 列迁移为 TIMESTAMP（UTC）。"""
+    table_name = f"{schema}.earthquakes" if schema else "earthquakes"
+    info = _column_info(conn, schema, "time")
+    if info is None or info[0] != "VARCHAR":
+        return
+
+    logger.info("迁移 time 列: VARCHAR -> TIMESTAMP...")
+    _alter_with_indexes(conn, schema, f"""
+        ALTER TABLE {table_name}
+        ALTER COLUMN time TYPE TIMESTAMP USING CAST(time AS TIMESTAMP)
+    """)
+    logger.info("✓ time 列已迁移")
+
+
+def enforce_geom_not_null(conn: duckdb.DuckDBPyConnection, schema: str = "") -> None:
+    """旧表补齐 geom 后加上 NOT NULL 约束，查询无需再逐行判断 geom IS NOT NULL。"""
+    table_name = f"{schema}.earthquakes" if schema else "earthquakes"
+    info = _column_info(conn, schema, "geom")
+    if info is None or not info[1]:
+        return
+
+    missing = conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE geom IS NULL").fetchone()[0]
+    if missing:
+        logger.warning("仍有 %d 条记录缺少 geom（经纬度为空），跳过 NOT NULL 约束", missing)
+        return
+
+    _alter_with_indexes(conn, schema, f"ALTER TABLE {table_name} ALTER COLUMN geom SET NOT NULL")
+    logger.info("✓ geom 列已设为 NOT NULL")
+
+
 def optimize_settings(conn: duckdb.DuckDBPyConnection) -> None:
     """优化数据库设置。"""
     logger.info("优化数据库设置...")
@@ -137,13 +247,21 @@ def main() -> None:
     try:
         schema = "db" if use_attach else ""
         
-        # 1. 创建表结构
+        # 1. 迁移旧表结构
+        migrate_time_column(conn, schema)
+        
+        # 2. 创建表结构
         create_tables(conn, schema)
         
-        # 2. 优化设置
+        # 3. 补齐旧数据的 geom
+        backfill_geom(conn, schema)
+        backfill_unit_vectors(conn, schema)
+        enforce_geom_not_null(conn, schema)
+        
+        # 4. 优化设置
         optimize_settings(conn)
         
-        # 3. 显示信息
+        # 5. 显示信息
         show_info(conn, schema)
         
         logger.info("✓ 数据库初始化完成")
@@ -1,14 +1,15 @@
 # -*- coding: utf-8 -*-
 """监听 EMSC 的地震 WebSocket，把数据实时写入 DuckDB。"""
 
-import json
+import asyncio
 import logging
 import signal
 import sys
-from datetime import datetime
-from typing import Any, Dict, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
 
-from tornado import gen, websocket
+import orjson
+from tornado import websocket
 from tornado.ioloop import IOLoop, PeriodicCallback
 
 import database
@@ -17,71 +18,131 @@ WS_URL = "wss://www.seismicportal.eu/standing_order/websocket"
 PING_INTERVAL = 15
 RECONNECT_DELAY = 5  # 断线重连延迟（秒）
 RESTART_INTERVAL = 3600  # 定时重启间隔（秒），0 表示不重启
+FLUSH_INTERVAL = 1.0  # 批量写入间隔（秒）
+FLUSH_MAX_EVENTS = 500  # 缓冲达到该条数时立即写入
 
 logger = logging.getLogger(__name__)
 
 # 当前连接实例
 _current_ws: Optional[websocket.WebSocketClientConnection] = None
 
+# 待写入的事件缓冲，由 IOLoop 定时批量写入
+_pending: List[Dict[str, Any]] = []
+_flush_handle: Optional[object] = None
+
+
+def install_uvloop() -> None:
+    """安装了 uvloop 时用它替换 asyncio 默认事件循环；须在创建 IOLoop 之前调用。"""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+def _parse_utc(value: str) -> datetime:
+    """把 ISO 8601 时间解析为 naive UTC datetime；EMSC 的 "Z" 结尾时间直接去掉后缀解析。"""
+    if value.endswith("Z"):
+        return datetime.fromisoformat(value[:-1])
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
 
 def process_message(raw_message: str) -> None:
     """解析一条 WebSocket 消息，并把有效事件写入数据库。"""
     try:
-        data: Dict[str, Any] = json.loads(raw_message)
-    except json.JSONDecodeError:
+        data: Dict[str, Any] = orjson.loads(raw_message)
+    except orjson.JSONDecodeError:
         logger.warning("Not JSON, skipped: %r", raw_message)
         return
 
-    event = data.get("data", {})
-    props = event.get("properties", {})
-    geometry = event.get("geometry", {})
-
-    event_time = props.get("time", "")
-    magnitude = props.get("mag")
-    region = props.get("flynn_region", "")
-    unid = props.get("unid")
-    depth = props.get("depth")
-
-    coordinates = geometry.get("coordinates", [None, None])
-    longitude, latitude = coordinates[0], coordinates[1]
+    # EMSC 消息结构固定，直接按路径取值，缺字段或类型不符时统一走一个异常分支
+    try:
+        event = data["data"]
+        props = event["properties"]
+        unid = props["unid"]
+        magnitude = props["mag"]
+        event_time = props["time"]
+        region = props.get("flynn_region", "")
+        depth = props.get("depth")
+        longitude, latitude = event["geometry"]["coordinates"][:2]
+    except (KeyError, TypeError, ValueError):
+        logger.warning("Incomplete event, skipped.")
+        return
 
-    if None in (unid, longitude, latitude, magnitude) or not event_time:
+    if unid is None or longitude is None or latitude is None or magnitude is None or not event_time:
         logger.warning("Incomplete event, skipped.")
         return
 
-    region = region.replace(",", " ")
+    try:
+        event_time = _parse_utc(event_time)
+    except (TypeError, AttributeError, ValueError):
+        logger.warning("Invalid event time %r, skipped.", event_time)
+        return
 
+    # 数值逐条转换为 float（兼容 "3.3" 这类数字字符串），无法转换时只跳过该事件
     try:
-        event_time = datetime.fromisoformat(event_time.replace("Z", "+00:00")).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-    except Exception:
-        pass
+        latitude = float(latitude)
+        longitude = float(longitude)
+        magnitude = float(magnitude)
+        depth = float(depth) if depth is not None else None
+    except (TypeError, ValueError):
+        logger.warning("Invalid numeric field, skipped.")
+        return
 
+    # region 中的逗号在 INSERT 中替换
     quake_data = {
         "unid": unid,
         "time": event_time,
-        "latitude": float(latitude),
-        "longitude": float(longitude),
-        "magnitude": float(magnitude),
+        "latitude": latitude,
+        "longitude": longitude,
+        "magnitude": magnitude,
         "region": region,
-        "depth": float(depth) if depth is not None else None,
+        "depth": depth,
     }
 
-    if database.insert_earthquake(quake_data):
+    if logger.isEnabledFor(logging.INFO):
         logger.info(
-            "New EQ: M%.1f %s (%.4f, %.4f)",
-            float(magnitude),
+            "Received EQ: M%.1f %s (%.4f, %.4f)",
+            magnitude,
             region,
-            float(latitude),
-            float(longitude),
+            latitude,
+            longitude,
         )
-
-
-@gen.coroutine
-def listen(ws: websocket.WebSocketClientConnection):
+    _enqueue(quake_data)
+
+
+def _enqueue(quake_data: Dict[str, Any]) -> None:
+    """把事件放入缓冲，按时间间隔或条数上限触发批量写入。"""
+    global _flush_handle
+    _pending.append(quake_data)
+    if len(_pending) >= FLUSH_MAX_EVENTS:
+        flush_pending()
+    elif _flush_handle is None:
+        _flush_handle = IOLoop.current().call_later(FLUSH_INTERVAL, flush_pending)
+
+
+def flush_pending() -> int:
+    """把缓冲中的事件以一次批量 INSERT 写入数据库，返回新写入的条数。"""
+    global _pending, _flush_handle
+    if _flush_handle is not None:
+        IOLoop.current().remove_timeout(_flush_handle)
+        _flush_handle = None
+    if not _pending:
+        return 0
+    rows, _pending = _pending, []
+    inserted = database.insert_earthquakes(rows)
+    logger.info("Flushed %d events, %d new", len(rows), inserted)
+    return inserted
+
+
+async def listen(ws: websocket.WebSocketClientConnection) -> None:
     """持续从 WebSocket 读取消息。"""
     try:
         while True:
-            msg = yield ws.read_message()
+            msg = await ws.read_message()
             if msg is None:
                 logger.warning("WebSocket closed by server.")
                 break
@@ -90,19 +151,18 @@ def listen(ws: websocket.WebSocketClientConnection):
         logger.info("Listen loop interrupted: %s", e)
 
 
-@gen.coroutine
-def launch_client():
+async def launch_client() -> None:
     """建立 WebSocket 连接并开始监听，断线自动重连。"""
     global _current_ws
 
     while True:
         try:
             logger.info("Connecting to %s", WS_URL)
-            _current_ws = yield websocket.websocket_connect(
+            _current_ws = await websocket.websocket_connect(
                 WS_URL, ping_interval=PING_INTERVAL
             )
             logger.info("Connected, start listening...")
-            yield listen(_current_ws)
+            await listen(_current_ws)
         except Exception as e:
             # 如果是主动关闭，不再重连
             if "closed" in str(e).lower() or not IOLoop.current().is_running():
@@ -117,7 +177,7 @@ def launch_client():
             break
             
         logger.info("Will reconnect in %d seconds...", RECONNECT_DELAY)
-        yield gen.sleep(RECONNECT_DELAY)
+        await asyncio.sleep(RECONNECT_DELAY)
 
 
 def restart_connection():
@@ -130,7 +190,8 @@ def restart_connection():
 
 def start_listener_loop():
     """在当前线程启动 IOLoop 并监听 WebSocket（独立运行模式）。"""
-    loop = IOLoop.instance()
+    install_uvloop()
+    loop = IOLoop.current()
     loop.spawn_callback(launch_client)
 
     # 定时重启
@@ -156,6 +217,7 @@ def start_listener_loop():
     finally:
         if _current_ws is not None:
             _current_ws.close()
+        flush_pending()
         logger.info("Listener stopped")
 
 
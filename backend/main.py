@@ -1,8 +1,10 @@
 """统一入口：Tornado IOLoop 同时运行 Flask API 与 WebSocket 监听器。"""
 
 import logging
+import os
 import signal
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from tornado.httpserver import HTTPServer
 from tornado.ioloop import IOLoop, PeriodicCallback
@@ -12,6 +14,8 @@ import api
 import database
 import listener
 
+API_THREADS = int(os.environ.get("API_THREADS", "8"))  # 执行 Flask 请求的线程数
+
 
 def main() -> None:
     logging.basicConfig(
@@ -26,10 +30,15 @@ def main() -> None:
     log.setLevel(logging.INFO)
     log.propagate = False
 
+    listener.install_uvloop()
     loop = IOLoop.current()
 
-    # Flask 通过 WSGIContainer 嵌入 Tornado
-    http_server = HTTPServer(WSGIContainer(api.app))
+    # 新地震写入后清空接口缓存
+    database.add_write_hook(api.cache.clear)
+
+    # Flask 通过 WSGIContainer 嵌入 Tornado；请求在线程池中执行，DuckDB 查询不阻塞 IOLoop 上的 WebSocket 监听
+    api_executor = ThreadPoolExecutor(max_workers=API_THREADS, thread_name_prefix="api")
+    http_server = HTTPServer(WSGIContainer(api.app, executor=api_executor))
     http_server.listen(5000, address="0.0.0.0")
     logging.info("Flask API 已启动: http://0.0.0.0:5000")
 
@@ -50,12 +59,16 @@ def main() -> None:
             if listener._current_ws is not None:
                 listener._current_ws.close()
             
+            # 写入尚在缓冲中的事件
+            listener.flush_pending()
+            
             # 关闭数据库连接池
             if database._connection_pool is not None:
                 database._connection_pool.close()
             
             # 停止 HTTP 服务器
             http_server.stop()
+            api_executor.shutdown(wait=False)
             
             # 停止事件循环
             loop.stop()
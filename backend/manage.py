@@ -1,39 +1,95 @@
-"""Simple script to pre-create the DuckDB database schema."""
+"""Simple script to pre-create the DuckDB database schema and bulk-load CSV exports."""
 
+import sys
 from pathlib import Path
 
 import duckdb
 
 
 DB_PATH = Path(__file__).resolve().with_name("earthquakes.duckdb")
-REQUIRED_EXTENSIONS = ("spatial", "geo")
+REQUIRED_EXTENSIONS = ("spatial",)
 SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS earthquakes (
     unid VARCHAR PRIMARY KEY,
-    time VARCHAR NOT NULL,
+    time TIMESTAMP NOT NULL,
     latitude DOUBLE,
     longitude DOUBLE,
     depth DOUBLE,
     magnitude DOUBLE,
     region VARCHAR,
-    geom GEOMETRY,
+    geom GEOMETRY NOT NULL,
+    cx DOUBLE,
+    cy DOUBLE,
+    cz DOUBLE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 )
 """
 
 
-def init_db() -> None:
-    """Create the DuckDB file, install extensions, and ensure the schema exists."""
+IMPORT_CSV_SQL = """
+INSERT INTO earthquakes (unid, time, latitude, longitude, depth, magnitude, region, geom, cx, cy, cz)
+SELECT
+    unid,
+    CAST(time AS TIMESTAMP),
+    latitude,
+    longitude,
+    {depth},
+    magnitude,
+    region,
+    ST_Point(longitude, latitude),
+    cos(radians(latitude)) * cos(radians(longitude)),
+    cos(radians(latitude)) * sin(radians(longitude)),
+    sin(radians(latitude))
+FROM staging
+WHERE unid IS NOT NULL AND time IS NOT NULL
+    AND latitude IS NOT NULL AND longitude IS NOT NULL AND magnitude IS NOT NULL
+ON CONFLICT (unid) DO NOTHING
+"""
+
+
+def _connect() -> duckdb.DuckDBPyConnection:
     conn = duckdb.connect(str(DB_PATH), read_only=False)
-    try:
-        for ext in REQUIRED_EXTENSIONS:
+    for ext in REQUIRED_EXTENSIONS:
+        # Already-installed extensions load directly; INSTALL (and its download check) only on a miss
+        try:
+            conn.execute(f"LOAD {ext}")
+        except duckdb.Error:
             conn.execute(f"INSTALL {ext}")
             conn.execute(f"LOAD {ext}")
+    return conn
+
+
+def init_db() -> None:
+    """Create the DuckDB file, install extensions, and ensure the schema exists."""
+    conn = _connect()
+    try:
         conn.execute(SCHEMA_SQL)
         print(f"[OK] Database ready at {DB_PATH}")
     finally:
         conn.close()
 
 
+def import_csv(csv_path: Path) -> int:
+    """Bulk-load a CSV export with DuckDB's CSV reader in one INSERT; existing unids are skipped."""
+    conn = _connect()
+    try:
+        conn.execute(SCHEMA_SQL)
+        # time is read as text so the 'Z' suffix is parsed as UTC by the TIMESTAMP cast
+        conn.execute(
+            "CREATE TEMP TABLE staging AS SELECT * FROM read_csv_auto(?, header = true, types = {'time': 'VARCHAR'})",
+            [str(csv_path)],
+        )
+        columns = {row[0] for row in conn.execute("DESCRIBE staging").fetchall()}
+        depth = "depth" if "depth" in columns else "NULL"
+        inserted = conn.execute(IMPORT_CSV_SQL.format(depth=depth)).fetchone()[0]
+        print(f"[OK] Imported {inserted} new rows from {csv_path}")
+        return inserted
+    finally:
+        conn.close()
+
+
 if __name__ == "__main__":
-    init_db()
+    if len(sys.argv) > 1:
+        import_csv(Path(sys.argv[1]))
+    else:
+        init_db()
@@ -1,6 +1,6 @@
 """业务逻辑层：封装查询组合与 GeoJSON 构建。"""
 
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
 import database
 
@@ -10,7 +10,7 @@ def recent_events(hours: int) -> List[Dict]:
     return database.get_recent_earthquakes(hours=hours)
 
 
-def events(
+def _events_query(
     hours: int,
     lon: Optional[float] = None,
     lat: Optional[float] = None,
@@ -19,8 +19,7 @@ def events(
     min_lat: Optional[float] = None,
     max_lon: Optional[float] = None,
     max_lat: Optional[float] = None,
-) -> Dict:
-    """根据圆或矩形条件返回 GeoJSON。"""
+) -> database.EarthquakeQuery:
     query = database.EarthquakeQuery().since(hours)
     
     if lon is not None and lat is not None and radius_km is not None:
@@ -28,10 +27,20 @@ def events(
     elif None not in (min_lon, min_lat, max_lon, max_lat):
         query = query.in_bbox(min_lon, min_lat, max_lon, max_lat)
     
-    return query.to_geojson()
+    return query
 
 
-def nearby(lon: float, lat: float, radius_km: float, hours: int) -> Dict:
+def events(hours: int, **filters: Optional[float]) -> bytes:
+    """根据圆或矩形条件返回 GeoJSON 字节串。"""
+    return _events_query(hours, **filters).to_geojson()
+
+
+def events_flatgeobuf(hours: int, **filters: Optional[float]) -> bytes | None:
+    """根据圆或矩形条件返回 FlatGeobuf 二进制。"""
+    return _events_query(hours, **filters).to_flatgeobuf()
+
+
+def nearby(lon: float, lat: float, radius_km: float, hours: int) -> bytes:
     """圆形范围查询并返回 GeoJSON。"""
     return database.EarthquakeQuery().since(hours).within_radius(lon, lat, radius_km).to_geojson()
 
@@ -39,20 +48,23 @@ def nearby(lon: float, lat: float, radius_km: float, hours: int) -> Dict:
 def buffered(radius_km: float, hours: int) -> Dict:
     """缓冲区查询结果转为 GeoJSON。"""
     rows = database.buffered_events(radius_km=radius_km, hours=hours)
-    # buffered_events 返回带 buffer_geojson 字段的特殊格式，需要特殊处理
-    features = []
-    for row in rows:
-        if row.get("buffer_geojson"):
-            try:
-                geometry = database.json.loads(row["buffer_geojson"])
-                properties = {k: v for k, v in row.items() if k != "buffer_geojson"}
-                features.append({"type": "Feature", "geometry": geometry, "properties": properties})
-            except Exception:
-                pass
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [row.pop("buffer_ring")]},
+            "properties": row,
+        }
+        for row in rows
+    ]
     return {"type": "FeatureCollection", "features": features}
 
 
-def overlay(geom_text: str, hours: int) -> Dict:
+def buffered_flatgeobuf(radius_km: float, hours: int) -> bytes | None:
+    """缓冲区查询结果转为 FlatGeobuf 二进制。"""
+    return database.buffered_events_flatgeobuf(radius_km=radius_km, hours=hours)
+
+
+def overlay(geom_text: str, hours: int) -> bytes:
     """叠加分析结果转为 GeoJSON。"""
     return database.EarthquakeQuery().since(hours).intersects(geom_text).to_geojson()
 
@@ -67,6 +79,6 @@ def cluster_stats(cell_km: float, hours: int) -> List[Dict]:
     return database.cluster_grid(cell_km=cell_km, hours=hours)
 
 
-def timeline(start_iso: str | None, end_iso: str | None, limit: int) -> Dict:
-    """时间范围结果转为 GeoJSON。"""
-    return database.EarthquakeQuery().time_range(start_iso, end_iso).order_by("time ASC").limit(limit).to_geojson()
+def timeline(start_iso: str | None, end_iso: str | None, limit: int) -> Iterator[List[Dict[str, Any]]]:
+    """时间范围结果，按时间升序逐批产出 GeoJSON Feature 列表。"""
+    return database.EarthquakeQuery().time_range(start_iso, end_iso).order_by("time ASC").limit(limit).iter_feature_batches()